@@ -1,57 +1,222 @@
 # File: audio_fingerprint.py
-from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, 
-                            QHeaderView, QProgressBar, QPushButton, QFileDialog, QLabel)
-import librosa
+# librosa , imagehash , PIL and sklearn are imported inside the methods that use them
+# so importing this module (and starting the app) stays fast
 import numpy as np
-from scipy.signal import find_peaks
-import imagehash
-from PIL import Image
+import hashlib
 import json
 import os
-from sklearn.metrics.pairwise import cosine_similarity
-import pandas as pd
+import threading
+import time
+from fingerprint_store import FingerprintStore
+
+# default similarity weights , overridden by a tuned profile (see tune_weights.py)
+DEFAULT_WEIGHTS = {
+    'mfccs': 0.3, # calculate all freq responce 
+    'chroma': 0.2, # Main 12 tones > do , ra , me ...
+    'tempo': 0.1,  # Beats per minute 
+    'onset': 0.1,  #strength of new starts
+    'spectral': 0.1, #contarst
+    'harmonic': 0.1,  #harmonic with percussive 
+    'hash': 0.1
+}
+FEATURE_NAMES = list(DEFAULT_WEIGHTS)
+
+
 class AudioFingerprint:
-    def __init__(self):
+    def __init__(self, background=False, robust=False):
         self.features = {}
-        self.database_path = "fingerprints_db.json"
-        self.load_features()
+        # robust=True scores with gain / eq / offset invariant features and peak hashes (noisy recordings)
+        self.robust = robust
+        # append-only segment log (see fingerprint_store.py) , the old single json file is migrated once
+        self.database_path = "fingerprints_db"
+        self.legacy_database_path = "fingerprints_db.json"
+        self.store = FingerprintStore(self.database_path)
+        self.weights_path = "weights_profile.json"
+        # mel spectrograms of recent queries (not saved) , reused by spec_Widget instead of a new stft
+        self.spectrograms = {}
+        self.max_spectrograms = 8
+        # robust mode summaries per fingerprint (not saved , the fingerprints are left untouched)
+        self._robust_cache = {}
+        self.max_robust_queries = 64
+        # packed catalog for batch scoring , built on first use and then updated per song
+        self._index = None
+        # (size , mtime_ns) of files that failed to fingerprint , retried by sync_folder once they change
+        self._failed_sources = {}
+        self.loaded = threading.Event()
+        if background:
+            # the gui shows up while the catalog is read , queries wait on self.loaded
+            threading.Thread(target=self.load_features, daemon=True).start()
+        else:
+            self.load_features()
+        self.weights = self.load_weights()
 
 
     def load_features(self):
-        """Load precomputed fingerprints from the database file."""
-        if os.path.exists(self.database_path):
-            with open(self.database_path, 'r') as f:
-                self.features = json.load(f)
-                print("readed the database")
+        """Load a consistent snapshot of the precomputed fingerprints."""
+        try:
+            features = self.store.load()
+            # only into a store that was never written , deleted songs must not come back
+            if not self.store.imported() and os.path.exists(self.legacy_database_path):
+                features = self.store.import_json(self.legacy_database_path)
+                print(f"migrated {self.legacy_database_path} to {self.database_path}")
+            self.features = features
+            self._index = None
+            print("readed the database")
+        finally:
+            self.loaded.set()
         # else:
         #     self.features = {}
         #     self.save_features()
 
-    def save_features(self):
-        """Save fingerprints to the database file."""
-        with open(self.database_path, 'w') as f:
-            json.dump(self.features, f)
+    def refresh_features(self):
+        """Pick up songs committed by other processes since the last load (reads only the new records)."""
+        self.wait_until_loaded()
+        touched = self.store.refresh(self.features)
+        if touched is None:
+            self._index = None
+        else:
+            self._update_index(touched)
+
+    def _update_index(self, songs):
+        """Repack only these songs in the batch index (removed songs are dropped)"""
+        if self._index is None or not songs:
+            return
+        self._index.remove([song for song in songs if song not in self.features])
+        self._index.upsert({song: self.features[song] for song in songs if song in self.features})
+
+    def wait_until_loaded(self):
+        """Block until the fingerprint database is loaded."""
+        self.loaded.wait()
+
+    def load_weights(self):
+        """Load the tuned similarity weights profile , fall back to the defaults."""
+        weights = dict(DEFAULT_WEIGHTS)
+        if os.path.exists(self.weights_path):
+            with open(self.weights_path, 'r') as f:
+                profile = json.load(f)
+            weights.update({name: float(profile['weights'][name])
+                            for name in FEATURE_NAMES if name in profile['weights']})
+            print(f"loaded weights profile : {weights}")
+        return weights
+
+    def save_features(self, songs=None):
+        """Append the given songs' fingerprints (default: all) to the database."""
+        if songs is None:
+            songs = list(self.features)
+        self.store.put_many((song, self.features[song]) for song in songs)
 
     def precompute_fingerprints(self, database_folder):
         """Precompute and save fingerprints for all songs in the database."""
+        self.wait_until_loaded()
         songs = [f for f in os.listdir(database_folder) 
                  if f.lower().endswith(('.mp3', '.wav'))]
+        added = []
         for song in songs:
             song_path = os.path.join(database_folder, song)
-            if song not in self.features:
+            old_fingerprint = self.features.get(song)
+            # in robust mode , fingerprints from before peak hashes existed are generated again
+            if song not in self.features or (self.robust and old_fingerprint and 'peak_hashes' not in old_fingerprint):
                 fingerprint = self.generate_fingerprint(song_path)
                 if fingerprint:
                     self.features[song] = fingerprint
-                    print(f"Fingerprint generated for {song}")
+                    # committed right away , costs only this song
+                    self.store.put(song, fingerprint)
+                    added.append(song)
+                    print(f"Fingerprint {'updated' if old_fingerprint else 'generated'} for {song}")
                 else:
                     print(f"Failed to generate fingerprint for {song}")
-        self.save_features()
+        self.refresh_features()
+        self._update_index(added)
+        self.store.compact_in_background(len(self.features))
+
+    def sync_folder(self, database_folder):
+        """
+        Bring the catalog in line with the folder: fingerprint added and changed songs , drop removed ones.
+        Size and mtime are compared first , the content hash is only read when they differ , so a sync
+        without changes is a directory listing. Songs fingerprinted before sync existed are trusted and
+        get their size / mtime / hash recorded on the first sync (a small source record , the
+        fingerprint itself is not rewritten). Files that cannot be read are skipped until the next
+        sync , files that fail to fingerprint until they change again. In robust mode fingerprints
+        without peak hashes (older builds) are generated again.
+        Returns (added , changed , removed) song names.
+        """
+        self.wait_until_loaded()
+        self.refresh_features()
+        start = time.perf_counter()
+        found, unreadable = {}, set()
+        with os.scandir(database_folder) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith(('.mp3', '.wav')):
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            found[entry.name] = (entry.path, stat.st_size, stat.st_mtime_ns)
+                    except OSError as e:
+                        unreadable.add(entry.name)
+                        print(f"Skipped {entry.name}: {e}")
+
+        added, changed, sources = [], [], []
+        for song, (song_path, size, mtime_ns) in found.items():
+            fingerprint = self.features.get(song)
+            source = self.store.sources.get(song)
+            # in robust mode , fingerprints from before peak hashes existed are generated again
+            outdated = self.robust and bool(fingerprint) and 'peak_hashes' not in fingerprint
+            if source and source['size'] == size and source['mtime_ns'] == mtime_ns and not outdated:
+                continue  # unchanged
+            if self._failed_sources.get(song) == (size, mtime_ns):
+                continue  # failed before and not changed since
+            try:
+                new_source = {'size': size, 'mtime_ns': mtime_ns, 'sha1': file_hash(song_path)}
+            except OSError as e:
+                # removed or locked since the listing , try again on the next sync
+                print(f"Skipped {song}: {e}")
+                continue
+            if fingerprint and not outdated and (source is None or source['sha1'] == new_source['sha1']):
+                # same content (touched , copied back , or fingerprinted before sync) >> only record it
+                sources.append((song, new_source))
+                continue
+            new_fingerprint = self.generate_fingerprint(song_path)
+            if not new_fingerprint:
+                print(f"Failed to generate fingerprint for {song}")
+                self._failed_sources[song] = (size, mtime_ns)
+                continue
+            self._failed_sources.pop(song, None)
+            self.features[song] = new_fingerprint
+            # committed right away , costs only this song
+            self.store.put(song, new_fingerprint)
+            sources.append((song, new_source))
+            (changed if fingerprint else added).append(song)
+            print(f"Fingerprint {'updated' if fingerprint else 'generated'} for {song}")
+
+        removed = [song for song in self.features if song not in found and song not in unreadable]
+        for song in removed:
+            del self.features[song]
+        self.store.delete_many(removed)
+        self.store.put_sources(sources)
+        self._update_index(added + changed + removed)
+        if added or changed or removed:
+            self.store.compact_in_background(len(self.features))
+            print(f"synced {database_folder} in {time.perf_counter() - start:.3f}s : "
+                  f"{len(added)} added , {len(changed)} changed , {len(removed)} removed")
+        return added, changed, removed
+
+    def wait_for_compaction(self):
+        """Block until a background compaction of the database is done (scripts call it before exiting)."""
+        self.store.wait_for_compaction()
+
+    def watch_folder(self, database_folder, interval=2.0, stop_event=None):
+        """Poll the folder and sync it every interval seconds until stop_event is set."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.sync_folder(database_folder)
+            stop_event.wait(interval)
 
 
 
 #############################################################################################################3
     def extract_features(self, audio_data, sr):
         """Extract more robust features for audio fingerprinting"""
+        import librosa
         features = {}
         
         # 1. Compute mel-spectrogram with more bands for better frequency resolution
@@ -100,16 +265,62 @@ class AudioFingerprint:
     
     def compute_similarity(self, fingerprint1, fingerprint2):
         """Compute improved similarity measure between two fingerprints"""
-        weights = {
-            'mfccs': 0.3, # calculate all freq responce 
-            'chroma': 0.2, # Main 12 tones > do , ra , me ...
-            'tempo': 0.1,  # Beats per minute 
-            'onset': 0.1,  #strength of new starts
-            'spectral': 0.1, #contarst
-            'harmonic': 0.1,  #harmonic with percussive 
-            'hash': 0.1
-        }
+        scores = self.compute_feature_scores(fingerprint1, fingerprint2)
+
+        # Compute weighted average
+        final_similarity = sum(
+            self.weights[name] * score for name, score in scores
+        )
         
+        return final_similarity
+
+    def catalog_index(self):
+        """Catalog packed for batch scoring (built on first use)"""
+        from catalog_index import CatalogIndex
+        self.wait_until_loaded()
+        if self._index is None:
+            self._index = CatalogIndex(self.features)
+        return self._index
+
+    def find_matches_batch(self, query_fingerprints, top_k=6):
+        """
+        Score many queries against the catalog in one pass (matrix products over blocks of songs).
+        Returns, per query, the best top_k match results , highest first: dicts with the song ,
+        the similarity and its per-feature breakdown (see catalog_index.make_result).
+        """
+        if self.robust:
+            # robust scores are not packed , score pair by pair
+            from catalog_index import make_result, ONSET_FRAME_SECONDS
+            self.wait_until_loaded()
+            results = []
+            for query_fingerprint in query_fingerprints:
+                matches = []
+                for song, fingerprint in self.features.items():
+                    if not fingerprint:
+                        continue
+                    # the peak hash offset comes out of the same scoring call
+                    feature_scores, offset = self.compute_robust_scores(
+                        query_fingerprint, fingerprint, return_offset=True)
+                    scores = [score for _, score in feature_scores]
+                    similarity = sum(self.weights[name] * score for name, score in zip(FEATURE_NAMES, scores))
+                    matches.append((song, similarity, scores, fingerprint, offset))
+                matches.sort(key=lambda x: x[1], reverse=True)
+                results.append([
+                    # peak hashes come from the mel spectrogram , same hop as the onset envelope
+                    make_result(song, similarity, scores, self.weights,
+                                {name: hamming_distance(h1, h2) for (name, h1), h2 in zip(
+                                    query_fingerprint['hashes'].items(), fingerprint['hashes'].values())},
+                                None if offset is None else offset * ONSET_FRAME_SECONDS)
+                    for song, similarity, scores, fingerprint, offset in matches[:top_k]
+                ])
+            return results
+        return self.catalog_index().top_k(query_fingerprints, self.weights, top_k)
+
+    def compute_feature_scores(self, fingerprint1, fingerprint2):
+        """Per-feature similarity scores as (name, score) pairs , in FEATURE_NAMES order"""
+        if self.robust:
+            return self.compute_robust_scores(fingerprint1, fingerprint2)
+        from sklearn.metrics.pairwise import cosine_similarity
         scores = []
         
         # 1. MFCC similarity
@@ -168,18 +379,120 @@ class AudioFingerprint:
         )) / len(fingerprint1['hashes'])
         scores.append(('hash', hash_sim))
         
-        # Compute weighted average
-        final_similarity = sum(
-            weights[name] * score for name, score in scores
+        return scores
+
+    def compute_robust_scores(self, fingerprint1, fingerprint2, return_offset=False):
+        """
+        Noise-robust per-feature scores , same names and order as compute_feature_scores.
+        Time-summary statistics (invariant to time offset) without the energy coefficient
+        (invariant to gain) , hamming distance of the perceptual hashes instead of exact
+        equality , and offset-consistent peak hash matches.
+        return_offset=True returns (scores , offset in frames of the peak hash match or None).
+        """
+        robust1 = self.robust_features(fingerprint1)
+        robust2 = self.robust_features(fingerprint2)
+        scores = []
+
+        # 1. MFCC statistics (mean , std of c1.. and deltas)
+        scores.append(('mfccs', _cosine(robust1['mfcc_stats'], robust2['mfcc_stats'])))
+
+        # 2. Average chroma profile
+        scores.append(('chroma', _cosine(robust1['chroma_profile'], robust2['chroma_profile'])))
+
+        # 3. Tempo similarity
+        tempo1 = fingerprint1['features']['tempo']
+        tempo2 = fingerprint2['features']['tempo']
+        scores.append(('tempo', 1 - abs(tempo1 - tempo2) / max(tempo1, tempo2, 1e-6)))
+
+        # 4. Onset envelopes compared at their best lag
+        onset1 = robust1['onset_normalized']
+        onset2 = robust2['onset_normalized']
+        n = min(len(onset1), len(onset2))
+        onset_sim = float(np.max(np.correlate(onset1, onset2, mode='full'))) / n if n else 0.0
+        scores.append(('onset', onset_sim))
+
+        # 5. Spectral contrast statistics
+        scores.append(('spectral', _cosine(robust1['contrast_stats'], robust2['contrast_stats'])))
+
+        # 6. Harmonic/Percussive ratios are already gain invariant
+        harmonic_sim = 1 - abs(
+            fingerprint1['features']['harmonic_ratio'] - fingerprint2['features']['harmonic_ratio']
         )
-        
-        return final_similarity
+        percussive_sim = 1 - abs(
+            fingerprint1['features']['percussive_ratio'] - fingerprint2['features']['percussive_ratio']
+        )
+        scores.append(('harmonic', (harmonic_sim + percussive_sim) / 2))
+
+        # 7. Peak hashes when both have them , else perceptual hashes by hamming distance
+        offset = None
+        if fingerprint1.get('peak_hashes') and fingerprint2.get('peak_hashes'):
+            hash_sim, offset = peak_hash_similarity(fingerprint1['peak_hashes'], fingerprint2['peak_hashes'])
+        else:
+            hash_sim = np.mean([1 - hamming_distance(h1, h2) / (len(h1) * 4) for h1, h2 in zip(
+                fingerprint1['hashes'].values(),
+                fingerprint2['hashes'].values()
+            )])
+        scores.append(('hash', hash_sim))
+
+        if return_offset:
+            return scores, offset
+        return scores
+
+    def robust_features(self, fingerprint):
+        """Normalized summaries used by compute_robust_scores , cached on the instance."""
+        # keyed by id , the entry keeps the fingerprint alive so its id is not reused
+        cached = self._robust_cache.get(id(fingerprint))
+        if cached is None or cached[0] is not fingerprint:
+            features = fingerprint['features']
+            mfccs = np.array(features['mfccs'])[1:]  # c0 is the loudness
+            deltas = np.array(features['mfcc_deltas'])[1:]
+            contrast = np.array(features['spectral_contrast'])
+            onset = np.array(features['onset_pattern'])
+            onset = (onset - onset.mean()) / (onset.std() + 1e-9)
+            summaries = {
+                'mfcc_stats': np.concatenate([mfccs.mean(axis=1), mfccs.std(axis=1), deltas.std(axis=1)]),
+                'chroma_profile': np.array(features['chroma']).mean(axis=1),
+                'contrast_stats': np.concatenate([contrast.mean(axis=1), contrast.std(axis=1)]),
+                'onset_normalized': onset
+            }
+            # room for the whole catalog plus the recent queries
+            if len(self._robust_cache) >= len(self.features) + self.max_robust_queries:
+                self._robust_cache.pop(next(iter(self._robust_cache)))  # drop the oldest
+            cached = self._robust_cache[id(fingerprint)] = (fingerprint, summaries)
+        return cached[1]
+
+    def compute_peak_hashes(self, mel_spec_db, neighborhood=15, fan_out=5, max_dt=63):
+        """
+        Landmark hashes from spectrogram peaks (shazam style).
+        Each peak is paired with the next fan_out peaks , a pair gives hash (f1 , f2 , dt) at time t1.
+        Returns a list of [hash , t1] , t1 in frames.
+        """
+        from scipy.ndimage import maximum_filter
+        # local maxima that stand out from the background
+        local_max = maximum_filter(mel_spec_db, size=neighborhood) == mel_spec_db
+        peaks = local_max & (mel_spec_db > np.percentile(mel_spec_db, 90))
+        freqs, times = np.nonzero(peaks)
+        order = np.argsort(times, kind='stable')
+        freqs, times = freqs[order], times[order]
+
+        hashes, anchors = [], []
+        for k in range(1, fan_out + 1):
+            dt = times[k:] - times[:-k]
+            valid = (dt > 0) & (dt <= max_dt)
+            # f1 , f2 < 128 (7 bits) , dt < 64 (6 bits)
+            hashes.append((freqs[:-k][valid] << 13) | (freqs[k:][valid] << 6) | dt[valid])
+            anchors.append(times[:-k][valid])
+        if not hashes:
+            return []
+        return np.stack([np.concatenate(hashes), np.concatenate(anchors)], axis=1).tolist()
 
     def compute_perceptual_hash(self, mel_spec_db):
         """
         Compute perceptual hashes from the mel spectrogram.
         Returns multiple hashes computed from different regions of the spectrogram.
         """
+        import imagehash
+        from PIL import Image
         # Normalize the mel spectrogram to 0-255 range for image processing
         mel_spec_normalized = ((mel_spec_db - mel_spec_db.min()) * 255 / 
                             (mel_spec_db.max() - mel_spec_db.min())).astype(np.uint8)
@@ -207,23 +520,108 @@ class AudioFingerprint:
         
         return hashes
         
-    def generate_fingerprint(self, audio_path):
-        """Generate a more comprehensive fingerprint."""
+    def generate_fingerprint(self, audio_path, keep_spectrogram=False):
+        """Generate a more comprehensive fingerprint. keep_spectrogram: keep the mel spectrogram in self.spectrograms (queries)."""
+        import librosa
         try:
             # Load audio with a consistent duration
             audio_data, sr = librosa.load(audio_path, duration=30)  # Use first 30 seconds
             print(f" sampling rate :{sr}")
-            # Extract features
-            features, mel_spec_db = self.extract_features(audio_data, sr)
-            
-            # Compute perceptual hashes
-            hashes = self.compute_perceptual_hash(mel_spec_db)
-            
-            return {
-                'name': os.path.basename(audio_path),
-                'features': features,
-                'hashes': hashes
-            }
+            return self._build_fingerprint(audio_data, sr, os.path.basename(audio_path), keep_spectrogram)
         except Exception as e:
             print(f"Error generating fingerprint for {audio_path}: {str(e)}")
             return None
+
+    def generate_fingerprint_from_audio(self, audio_data, sr, name, keep_spectrogram=False):
+        """Generate a fingerprint from an in-memory signal (e.g. the current mix) without a temp file."""
+        import librosa
+        try:
+            audio_data = np.asarray(audio_data, dtype=np.float32)
+            # same input as librosa.load(path, duration=30): mono , first 30 seconds , 22050 Hz
+            if audio_data.ndim > 1:
+                audio_data = audio_data.mean(axis=1)
+            audio_data = audio_data[:int(30 * sr)]
+            if sr != 22050:
+                audio_data = librosa.resample(audio_data, orig_sr=sr, target_sr=22050)
+                sr = 22050
+            return self._build_fingerprint(audio_data, sr, name, keep_spectrogram)
+        except Exception as e:
+            print(f"Error generating fingerprint for {name}: {str(e)}")
+            return None
+
+    def _build_fingerprint(self, audio_data, sr, name, keep_spectrogram=False):
+        # Extract features
+        features, mel_spec_db = self.extract_features(audio_data, sr)
+        if keep_spectrogram:
+            if len(self.spectrograms) >= self.max_spectrograms:
+                self.spectrograms.pop(next(iter(self.spectrograms)))
+            self.spectrograms[name] = (mel_spec_db, sr)
+
+        # Compute perceptual hashes
+        hashes = self.compute_perceptual_hash(mel_spec_db)
+
+        return {
+            'name': name,
+            'features': features,
+            'hashes': hashes,
+            'peak_hashes': self.compute_peak_hashes(mel_spec_db)
+        }
+
+
+def format_match(result):
+    """Multi-line text explaining one match result (for tooltips and the command line)"""
+    lines = [f"{result['song']} : {100 * result['similarity']:.1f}%"]
+    for name, score in result['scores'].items():
+        lines.append(f"  {name:<9} {100 * score:6.1f}%  (adds {100 * result['contributions'][name]:5.1f})")
+    distances = " , ".join(f"{name} {bits}" for name, bits in result['hash_distances'].items())
+    lines.append(f"  hash distances (bits) : {distances}")
+    if result['offset'] is not None:
+        lines.append(f"  best offset : {result['offset']:+.2f} s")
+    return "\n".join(lines)
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """sha1 of the file content , read in chunks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cosine(vector1, vector2):
+    vector1 = np.asarray(vector1)
+    vector2 = np.asarray(vector2)
+    norm = np.linalg.norm(vector1) * np.linalg.norm(vector2)
+    return float(np.dot(vector1, vector2) / norm) if norm else 0.0
+
+
+def hamming_distance(hash1, hash2):
+    """Number of differing bits between two hex hash strings"""
+    return bin(int(hash1, 16) ^ int(hash2, 16)).count('1')
+
+
+def peak_hash_similarity(peak_hashes1, peak_hashes2):
+    """
+    Fraction of the first fingerprint's peak hashes found in the second at one consistent
+    time offset. Returns (score , offset in frames or None when no hash matches).
+    """
+    query = np.asarray(peak_hashes1, dtype=np.int64)
+    song = np.asarray(peak_hashes2, dtype=np.int64)
+    song = song[np.argsort(song[:, 0], kind='stable')]
+
+    # all (query , song) pairs with equal hashes
+    low = np.searchsorted(song[:, 0], query[:, 0], side='left')
+    high = np.searchsorted(song[:, 0], query[:, 0], side='right')
+    counts = high - low
+    total = counts.sum()
+    if total == 0:
+        return 0.0, None
+    starts = np.repeat(low - np.cumsum(counts) + counts, counts)
+    song_index = starts + np.arange(total)
+    offsets = song[song_index, 1] - np.repeat(query[:, 1], counts)
+
+    # true matches agree on the offset , random collisions spread out
+    histogram = np.bincount(offsets - offsets.min())
+    best = int(np.argmax(histogram))
+    return min(1.0, histogram[best] / len(query)), best + int(offsets.min())
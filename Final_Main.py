@@ -1,24 +1,16 @@
-from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QSizePolicy, QApplication, 
-                            QMainWindow, QRadioButton, QButtonGroup, QFileDialog, QTabWidget)
-from PyQt5 import uic
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-import numpy as np
-import librosa.display
+import time
+_start_time = time.perf_counter()  # for --startup-benchmark
+from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog
+import importlib
+import math
 import sys
 import os
-from scipy.io import wavfile
 import logging
-import sounddevice as sd
-from PIL import Image, ImageQt, ImageEnhance
-from numpy.fft import ifft2, ifftshift
-from scipy.fft import fft2, fftshift
 # from mplwidget import spec_Widget
-from PyQt5 import QtCore
-from Features import  AudioFingerprint
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
-from PyQt5.QtMultimediaWidgets import QVideoWidget
-from PyQt5.QtCore import QUrl
+from PyQt5.QtCore import QTimer
+from Features import  AudioFingerprint, format_match
+from playback import ChunkedPlayer
+from mixer import MixEngine
 from PyQt5.QtGui import QIcon
 # Configure logging
 logging.basicConfig(
@@ -28,8 +20,20 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-# Load the UI file
-Ui_MainWindow, QtBaseClass = uic.loadUiType("First_UI.ui")
+
+def load_ui_class(ui_path="First_UI.ui", module_name="First_UI_compiled"):
+    """Import the Ui class compiled from the .ui file , compiling it again only when the .ui changed"""
+    compiled_path = f"{module_name}.py"
+    if not os.path.exists(compiled_path) or os.path.getmtime(compiled_path) < os.path.getmtime(ui_path):
+        from PyQt5 import uic
+        with open(compiled_path, 'w') as f:
+            uic.compileUi(ui_path, f)
+        logging.info(f"compiled {ui_path} to {compiled_path}")
+    return importlib.import_module(module_name).Ui_MainWindow
+
+
+# Load the UI (precompiled , no xml parsing on every launch)
+Ui_MainWindow = load_ui_class()
 
 class MainWindow(QMainWindow, Ui_MainWindow):
     def __init__(self):
@@ -40,14 +44,15 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.isplay = False
         self.first_file = None
         self.second_file = None
-        self.mixed_file = None
+        self.mixed_source = None
+        self.mixed_key = None
         self.played_sound = None
         self.paused_sound = None
         self.match_songs = [None]*6
         self.database_folder = "Data_base"
 
 
-        self.fingerprinter = AudioFingerprint()
+        self.fingerprinter = AudioFingerprint(background=True)
 
         self.First_Song_Weight.sliderReleased.connect(lambda :self.mix_files(self.first_file, self.second_file))
 
@@ -81,8 +86,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
 
         
-        # Initialize media player
-        self.player = QMediaPlayer()
+        # Initialize media player (streams decoded buffers , no temp files)
+        self.player = ChunkedPlayer()
         self.player.stateChanged.connect(self.handle_state_changed)
         
         # Initialize spectrogram and fingerprint
@@ -100,10 +105,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
     
     def handle_state_changed(self, state):
         """Handle media player state changes"""
-        if state == QMediaPlayer.StoppedState:
+        if state == ChunkedPlayer.StoppedState:
             self.played_sound = None
             self.paused_sound = None
-        elif state == QMediaPlayer.PausedState:
+        elif state == ChunkedPlayer.PausedState:
             self.paused_sound = self.played_sound
             self.played_sound = None
     
@@ -129,7 +134,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.second_song_Weight.setEnabled(True)
             self.second_song_Weight.setValue(100)
         self.player.stop()
-        self.mixed_file = self.mix_files(self.first_file, self.second_file)
+        self.mixed_source = self.mix_files(self.first_file, self.second_file)
     
 
 
@@ -155,8 +160,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         # Rest of file path determination code...
         file_path = None
-        if source == 'mixed' and self.mixed_file:
-            file_path = self.mixed_file
+        if source == 'mixed' and self.mixed_source:
+            file_path = 'mixed'
         elif source == 'first' and self.first_file:
             file_path = self.first_file
         elif source == 'second' and self.second_file:
@@ -166,7 +171,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             if idx < len(self.match_songs) and self.match_songs[idx] is not None:
                 file_path = os.path.join(self.database_folder, self.match_songs[idx])
         
-        if not file_path or not os.path.exists(file_path):
+        if not file_path or (file_path != 'mixed' and not os.path.exists(file_path)):
             print(f"Invalid file path: {file_path}")
             return
             
@@ -199,7 +204,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                     prev_button.setIcon(self.play_icon)
                     
             self.player.stop()
-            self.player.setMedia(QMediaContent(QUrl.fromLocalFile(file_path)))
+            if file_path == 'mixed':
+                self.player.setSource(self.mixed_source.reader())
+            else:
+                self.player.setSource(self._file_source(file_path))
             self.player.play()
             self.played_sound = source
             self.paused_sound = None
@@ -222,22 +230,26 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             return getattr(self, button_name, None)
         return None
 
+    def _file_source(self, file_path):
+        """Playback source for a single file played as-is (streamed , not decoded up front)"""
+        return MixEngine([file_path], [1.0]).reader()
+
     def handle_state_changed(self, state):
         """Handle media player state changes"""
         # Get current source button using helper method
         current_button = self._get_button_for_source(self.played_sound) if self.played_sound else None
 
-        if state == QMediaPlayer.StoppedState:
+        if state == ChunkedPlayer.StoppedState:
             print("Player stopped")
             self.played_sound = None
             self.paused_sound = None
             if current_button:
                 current_button.setIcon(self.play_icon)
-        elif state == QMediaPlayer.PausedState:
+        elif state == ChunkedPlayer.PausedState:
             print("Player paused")
             if current_button:
                 current_button.setIcon(self.play_icon)
-        elif state == QMediaPlayer.PlayingState:
+        elif state == ChunkedPlayer.PlayingState:
             print("Player playing")
             if current_button:
                 current_button.setIcon(self.pause_icon)
@@ -251,15 +263,15 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.First_Song_Weight.setValue(0)  
             self.First_Song_Weight.setEnabled(False)    
             self.label_song_1.setText(f"Input_1")
-            self.mixed_file = self.mix_files(self.first_file, self.second_file)
             self.player.stop()
+            self.mixed_source = self.mix_files(self.first_file, self.second_file)
         elif file==2 and self.second_file is not None:
             self.second_file=None
             self.second_song_Weight.setValue(0)
             self.second_song_Weight.setEnabled(False)  
             self.label_song_2.setText(f"Input_2")
-            self.mixed_file = self.mix_files(self.first_file, self.second_file)
             self.player.stop()
+            self.mixed_source = self.mix_files(self.first_file, self.second_file)
         if self.first_file is None and self.second_file is None:
             # self.Spec_Org_obj.clear()
 
@@ -279,15 +291,21 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
 
     def find_similar_songs(self, path):
-        """Find similar songs to the query audio using precomputed fingerprints."""
+        """Find similar songs to the query audio (file path or MixEngine) using precomputed fingerprints."""
         if not path or not self.database_folder:
             return
                 # Get list of songs and their fingerprints from the precomputed database
+        self.fingerprinter.wait_until_loaded()
         songs = list(self.fingerprinter.features.keys())
         self.progress_calculations.setMaximum(len(songs)+2)
         self.progress_calculations.setValue(1)
         # Generate fingerprint for the query audio
-        query_fingerprint = self.fingerprinter.generate_fingerprint(path)
+        if isinstance(path, MixEngine):
+            # only the first 30 seconds of the mix are needed for the fingerprint
+            query_fingerprint = self.fingerprinter.generate_fingerprint_from_audio(
+                path.query_audio(30), path.samplerate, 'output_mix', keep_spectrogram=True)
+        else:
+            query_fingerprint = self.fingerprinter.generate_fingerprint(path, keep_spectrogram=True)
         self.progress_calculations.setValue(2)
         print("The song Readed correctly ")
         if not query_fingerprint:
@@ -298,29 +316,28 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         
         
         
-        similarities = []
-        for i, song in enumerate(songs):
-            song_fingerprint = self.fingerprinter.features[song]
-            if song_fingerprint:
-                similarity = self.fingerprinter.compute_similarity(
-                    query_fingerprint, song_fingerprint)
-                similarities.append((song, similarity))
-            self.progress_calculations.setValue(i + 3)
-        
-        # Sort by similarity
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        # Score against the whole catalog in one vectorized pass , best 6 first
+        similarities = self.fingerprinter.find_matches_batch([query_fingerprint], top_k=6)[0]
+        self.progress_calculations.setValue(len(songs) + 2)
         
         # Update UI with results
-        for i, (song, similarity) in enumerate(similarities[:6]):
+        for i, result in enumerate(similarities[:6]):
+            song = result['song']
             self.match_songs[i]=song
+            # per-feature breakdown from the same scoring pass , shown on hover
+            explanation = format_match(result)
             
             # self.label_10.setText(f"Matching :{os.path.splitext(os.path.basename(path))[0]}")
             progress_bar = getattr(self, f"progressBar_{i+1}", None)
             if progress_bar:
+                # silent queries give nan scores (0 / 0 ratios)
+                similarity = result['similarity'] if math.isfinite(result['similarity']) else 0.0
                 progress_bar.setValue(int(similarity * 100))
+                progress_bar.setToolTip(explanation)
             label = getattr(self, f"label_{i+1}", None)
             if label:
                 label.setText(str(song))
+                label.setToolTip(explanation)
         print(self.match_songs)
 
     
@@ -335,14 +352,15 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             progress_bar = getattr(self, f"progressBar_{i+1}", None)
             if progress_bar:
                 progress_bar.setValue(0)
+                progress_bar.setToolTip("")
             label = getattr(self, f"label_{i+1}", None)
             if label:
                 label.setText(f"Song_{i+1}")
+                label.setToolTip("")
         # self.label_8.setText(f"Song_{8}")
     
     def mix_files(self, file1, file2):
-        """Mix two audio files with weights from sliders"""
-        # Read the two wav files
+        """Mix the loaded audio files (any supported format and rate) with weights from sliders"""
         if file1 is None and file2 is None :
             return 
         self.Reset_prograssbars()
@@ -352,54 +370,24 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.player.stop()
             return
         
-        rate1, data1 = wavfile.read(file1)
-        rate2, data2 = wavfile.read(file2)
-        
-        # Ensure the sampling rates match
-        if rate1 != rate2:
-            rate1 = min(rate1, rate2)
-        
-        # Ensure the data lengths match by trimming
-        min_length = min(len(data1), len(data2))
-        data1 = data1[:min_length]
-        data2 = data2[:min_length]
-        
-        # Normalize the data
-        if np.issubdtype(data1.dtype, np.integer):
-            data1 = data1 / np.iinfo(data1.dtype).max
-        if np.issubdtype(data2.dtype, np.integer):
-            data2 = data2 / np.iinfo(data2.dtype).max
-        
         # Get weights from sliders
-        weight1 = self.First_Song_Weight.value()
-        weight2 = self.second_song_Weight.value()
+        files = [file1, file2]
+        gains = [self.First_Song_Weight.value()/100, self.second_song_Weight.value()/100]
     
-        if weight1 == 0:
-            mixed_data = data2  # Use second song as-is
-        elif weight2 == 0:
-            mixed_data = data1  # Use first song as-is
+        # The mix is not written to a file , MixEngine resamples and mixes only the blocks that are read
+        # (the peak normalization of playback runs in the background)
+        if self.mixed_source is not None and self.mixed_key == tuple(files):
+            # same inputs , only the weights changed (keeps playing with the new weights)
+            self.mixed_source.set_gains(gains)
         else:
-            # Normal mixing when both weights are non-zero
-            mixed_data = ((weight1/100) * data1 + (weight2/100) * data2)
-            # Normalize only when actually mixing
-            mixed_data = mixed_data / np.max(np.abs(mixed_data))
-       
-       
-       
-        # Convert to 16-bit integer
-        mixed_data = np.int16(mixed_data * 32767)
-        
-        # Save mixed file
-        output_path = 'output_mix.wav'
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        wavfile.write(output_path, rate1, mixed_data)
+            self.mixed_source = MixEngine(files, gains)
+            self.mixed_key = tuple(files)
         print(f"first_one : {file1}")
         print(f"first_two : {file2}")
         print("new mixxx")
         self.Reset_prograssbars()
-        self.find_similar_songs(output_path)
-        return output_path
+        self.find_similar_songs(self.mixed_source)
+        return self.mixed_source
  
 
 
@@ -408,4 +396,10 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     mainWindow = MainWindow()
     mainWindow.show()
+    if "--startup-benchmark" in sys.argv:
+        # report once the event loop is running (window shown) , then quit
+        def report_startup():
+            print(f"time-to-window: {time.perf_counter() - _start_time:.3f}", flush=True)
+            app.quit()
+        QTimer.singleShot(0, report_startup)
     sys.exit(app.exec_())
\ No newline at end of file
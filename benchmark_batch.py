@@ -0,0 +1,63 @@
+"""
+Throughput of batch identification against one query at a time.
+
+Uses catalog fingerprints (or the fingerprints of the given files) as queries and
+compares queries per second of the compute_similarity loop with find_matches_batch.
+
+Usage:
+    python benchmark_batch.py --queries 200
+    python benchmark_batch.py clips/*.wav
+"""
+import argparse
+import time
+
+import numpy as np
+
+from Features import AudioFingerprint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch vs one-at-a-time query throughput")
+    parser.add_argument('files', nargs='*', help="query files (default: catalog songs)")
+    parser.add_argument('--queries', type=int, default=200, help="catalog songs used as queries")
+    parser.add_argument('--top-k', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fingerprinter = AudioFingerprint()
+    songs = [song for song, fingerprint in fingerprinter.features.items() if fingerprint]
+    if not songs:
+        raise SystemExit("the fingerprint database is empty , run precompute_fingerprints first")
+    if args.files:
+        queries = [fingerprinter.generate_fingerprint(path) for path in args.files]
+        queries = [query for query in queries if query]
+    else:
+        rng = np.random.default_rng(args.seed)
+        queries = [fingerprinter.features[songs[i]] for i in rng.integers(0, len(songs), args.queries)]
+
+    start = time.perf_counter()
+    single = []
+    for query in queries:
+        similarities = [(song, fingerprinter.compute_similarity(query, fingerprinter.features[song]))
+                        for song in songs]
+        similarities.sort(key=lambda x: x[1], reverse=True)
+        single.append(similarities[:args.top_k])
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fingerprinter.catalog_index()
+    index_time = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = fingerprinter.find_matches_batch(queries, args.top_k)
+    batch_time = time.perf_counter() - start
+
+    agree = np.mean([a[0][0] == b[0]['song'] for a, b in zip(single, batch)])
+    print(f"{len(queries)} queries against {len(songs)} songs")
+    print(f"one at a time : {len(queries) / single_time:10.1f} queries/s")
+    print(f"batch         : {len(queries) / batch_time:10.1f} queries/s "
+          f"({single_time / batch_time:.1f}x , index built once in {index_time:.2f}s)")
+    print(f"same top-1 for {100 * agree:.1f}% of the queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Robustness benchmark: how well degraded copies of catalog songs are still identified.
+
+Every selected song of the database folder is degraded (noise at several SNRs , gain ,
+low-pass , time offset , mp3-like re-encode) , fingerprinted as a query and matched
+against the catalog in the standard and the robust mode. Reports top-1 accuracy and
+per-query cost for each degradation and mode.
+
+Usage:
+    python benchmark_robustness.py Data_base --songs 20
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import librosa
+from scipy.signal import butter, sosfilt
+
+from Features import AudioFingerprint
+
+SR = 22050
+DURATION = 30
+OFFSET = 2.5  # seconds cut from the start for the time offset case
+
+
+def add_noise(audio, snr_db, rng):
+    noise = rng.standard_normal(len(audio)).astype(np.float32)
+    signal_power = np.mean(audio ** 2)
+    noise_power = signal_power / (10 ** (snr_db / 10))
+    return audio + noise * np.sqrt(noise_power)
+
+
+def low_pass(audio, cutoff):
+    sos = butter(8, cutoff, btype='low', fs=SR, output='sos')
+    return sosfilt(sos, audio).astype(np.float32)
+
+
+def mp3_like(audio, rng):
+    """Rough lossy-codec simulation: band limit , then coarse requantization with dither."""
+    audio = low_pass(audio, 7000)
+    step = 2.0 ** -9
+    dither = (rng.random(len(audio)) - 0.5) * step
+    return (np.round((audio + dither) / step) * step).astype(np.float32)
+
+
+def degradations(rng):
+    """name -> function(audio) for the first DURATION + OFFSET seconds of a song"""
+    clip = int(DURATION * SR)
+    offset = int(OFFSET * SR)
+    cases = {'clean': lambda audio: audio[:clip]}
+    for snr in (20, 10, 5, 0):
+        cases[f'noise {snr}dB'] = lambda audio, snr=snr: add_noise(audio[:clip], snr, rng)
+    cases['gain -12dB'] = lambda audio: audio[:clip] * 10 ** (-12 / 20)
+    cases['gain +6dB'] = lambda audio: np.clip(audio[:clip] * 10 ** (6 / 20), -1, 1)
+    cases['low-pass 3kHz'] = lambda audio: low_pass(audio[:clip], 3000)
+    cases[f'offset {OFFSET}s'] = lambda audio: audio[offset:offset + clip]
+    cases['mp3-like'] = lambda audio: mp3_like(audio[:clip], rng)
+    return cases
+
+
+def top_match(fingerprinter, query_fingerprint):
+    # same path as the app: packed batch scoring (standard) or pair by pair (robust)
+    return fingerprinter.find_matches_batch([query_fingerprint], top_k=1)[0][0]['song']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy vs cost under synthetic degradations")
+    parser.add_argument('database_folder')
+    parser.add_argument('--songs', type=int, default=20, help="catalog songs used as queries")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    fingerprinter = AudioFingerprint()
+    songs = [song for song, fingerprint in fingerprinter.features.items() if fingerprint]
+    if not songs:
+        raise SystemExit("the fingerprint database is empty , run precompute_fingerprints first")
+    selected = [songs[i] for i in rng.permutation(len(songs))[:args.songs]]
+    cases = degradations(rng)
+
+    # fingerprints are mode independent , build each degraded query once
+    queries = {case: [] for case in cases}
+    fingerprint_time = {case: 0.0 for case in cases}
+    for song in selected:
+        audio, _ = librosa.load(os.path.join(args.database_folder, song), sr=SR, duration=DURATION + OFFSET)
+        for case, degrade in cases.items():
+            start = time.perf_counter()
+            query = fingerprinter.generate_fingerprint_from_audio(degrade(audio), SR, f"{song} ({case})")
+            fingerprint_time[case] += time.perf_counter() - start
+            if query:
+                queries[case].append((song, query))
+        print(f"degraded {song}")
+
+    # the packed index and the robust mode summaries are built once , keep them out of the timing
+    fingerprinter.catalog_index()
+    for song in songs:
+        fingerprinter.robust_features(fingerprinter.features[song])
+
+    print(f"\n{'degradation':<16}{'mode':<10}{'top-1':>8}{'fingerprint ms':>16}{'match ms':>10}")
+    for case in cases:
+        for robust in (False, True):
+            fingerprinter.robust = robust
+            correct = 0
+            start = time.perf_counter()
+            for song, query in queries[case]:
+                correct += top_match(fingerprinter, query) == song
+            match_time = time.perf_counter() - start
+            n = max(len(queries[case]), 1)
+            print(f"{case:<16}{'robust' if robust else 'standard':<10}{correct / n:>8.3f}"
+                  f"{1000 * fingerprint_time[case] / n:>16.1f}{1000 * match_time / n:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Measure the app's time-to-window.
+
+Launches Final_Main.py --startup-benchmark several times and reports the wall time
+from process spawn until the main window is shown (interpreter start included),
+and the in-process time printed by the app.
+
+Usage:
+    python benchmark_startup.py --runs 5
+    QT_QPA_PLATFORM=offscreen python benchmark_startup.py   (no display)
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def measure_once():
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "Final_Main.py", "--startup-benchmark"],
+        stdout=subprocess.PIPE, text=True
+    )
+    in_process = None
+    for line in process.stdout:
+        if line.startswith("time-to-window:"):
+            wall = time.perf_counter() - start
+            in_process = float(line.split(":")[1])
+            break
+    process.wait()
+    if in_process is None:
+        raise RuntimeError("the app exited without reporting its startup time")
+    return wall, in_process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark application startup (time-to-window)")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    # the first launch also compiles First_UI.ui , keep it out of the stats
+    wall, in_process = measure_once()
+    print(f"cold run : {wall:.3f}s wall , {in_process:.3f}s in process")
+
+    walls, in_processes = [], []
+    for run in range(args.runs):
+        wall, in_process = measure_once()
+        walls.append(wall)
+        in_processes.append(in_process)
+        print(f"run {run + 1} : {wall:.3f}s wall , {in_process:.3f}s in process")
+
+    print(f"time-to-window median : {statistics.median(walls):.3f}s wall , "
+          f"{statistics.median(in_processes):.3f}s in process")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Catalog fingerprints packed into matrices for scoring many queries at once.
+
+Each cosine feature of compute_feature_scores becomes a row-normalized float32 matrix
+(songs x flattened feature) , so the cosine scores of a batch of queries against a block
+of songs are one matrix-matrix product. Songs are scored in blocks of block_bytes (16 MiB ,
+about 50 songs of 30 s): wide enough for efficient products , while the memory of the
+per-block scores stays bounded whatever the catalog size.
+"""
+import numpy as np
+
+from Features import FEATURE_NAMES
+
+COSINE_FEATURES = ['mfccs', 'mfcc_deltas', 'chroma', 'onset_pattern', 'spectral_contrast']
+# onset envelope frames are hop 512 at the fingerprint rate 22050 Hz
+ONSET_FRAME_SECONDS = 512 / 22050
+
+
+class CatalogIndex:
+    def __init__(self, features, block_bytes=16 * 1024 * 1024):
+        self.block_bytes = block_bytes
+        self.songs = [song for song, fingerprint in features.items() if fingerprint]
+        self.shapes = _feature_shapes([features[song] for song in self.songs])
+        self.data = _pack_fingerprints([features[song] for song in self.songs], self.shapes)
+        self.hash_names = list(features[self.songs[0]]['hashes']) if self.songs else []
+        self._update_layout()
+
+    def __len__(self):
+        return len(self.songs)
+
+    def _update_layout(self):
+        self.positions = {song: i for i, song in enumerate(self.songs)}
+        # songs per block so one block of every feature matrix fits in block_bytes
+        row_bytes = 4 * sum(matrix.shape[1] for matrix in self.data['matrices'].values())
+        self.block_rows = max(1, self.block_bytes // max(row_bytes, 1))
+
+    def query_arrays(self, query_fingerprints):
+        """Pack queries like the catalog (features padded / cut to the catalog's frames , then flattened)"""
+        return _pack_fingerprints(query_fingerprints, self.shapes, self.data['hashes'].shape[1],
+                                  hash_fill=np.iinfo(np.uint64).max - 1)
+
+    def upsert(self, features):
+        """Add new songs and replace the rows of changed ones , without repacking the rest"""
+        features = {song: fingerprint for song, fingerprint in features.items() if fingerprint}
+        if not features:
+            return
+        if not self.songs:
+            # nothing to keep , the sizes come from the new songs
+            self.songs = list(features)
+            self.shapes = _feature_shapes(list(features.values()))
+            self.data = _pack_fingerprints(list(features.values()), self.shapes)
+            self.hash_names = list(next(iter(features.values()))['hashes'])
+            self._update_layout()
+            return
+        packed = _pack_fingerprints(list(features.values()), self.shapes, self.data['hashes'].shape[1])
+        rows = np.array([self.positions.get(song, -1) for song in features])
+        existing = rows >= 0
+        for key, values in _flat_items(packed):
+            target = _flat_get(self.data, key)
+            target[rows[existing]] = values[existing]
+            _flat_set(self.data, key, np.concatenate([target, values[~existing]]))
+        self.songs.extend(song for song, row in zip(features, rows) if row < 0)
+        self._update_layout()
+
+    def remove(self, songs):
+        """Drop songs from the index"""
+        rows = [self.positions[song] for song in songs if song in self.positions]
+        if not rows:
+            return
+        keep = np.ones(len(self.songs), dtype=bool)
+        keep[rows] = False
+        for key, values in _flat_items(self.data):
+            _flat_set(self.data, key, values[keep])
+        self.songs = [song for song, kept in zip(self.songs, keep) if kept]
+        self._update_layout()
+
+    def block_scores(self, queries, start, stop):
+        """Per-feature scores of all queries against songs [start , stop): (queries, songs, FEATURE_NAMES)"""
+        q = queries['matrices']
+        catalog = self.data
+        c = {name: matrix[start:stop] for name, matrix in catalog['matrices'].items()}
+        scores = np.empty((len(queries['tempo']), stop - start, len(FEATURE_NAMES)), dtype=np.float32)
+
+        # 1. MFCC similarity (mfccs and their deltas)
+        scores[..., 0] = 0.5 * (q['mfccs'] @ c['mfccs'].T + q['mfcc_deltas'] @ c['mfcc_deltas'].T)
+        # 2. Chroma similarity
+        scores[..., 1] = q['chroma'] @ c['chroma'].T
+        # 3. Tempo similarity
+        tempo_q = queries['tempo'][:, None]
+        tempo_c = catalog['tempo'][None, start:stop]
+        scores[..., 2] = 1 - np.abs(tempo_q - tempo_c) / np.maximum(tempo_q, tempo_c)
+        # 4. Onset pattern similarity
+        scores[..., 3] = q['onset_pattern'] @ c['onset_pattern'].T
+        # 5. Spectral contrast similarity
+        scores[..., 4] = q['spectral_contrast'] @ c['spectral_contrast'].T
+        # 6. Harmonic/Percussive similarity
+        harmonic_sim = 1 - np.abs(queries['harmonic'][:, None] - catalog['harmonic'][None, start:stop])
+        percussive_sim = 1 - np.abs(queries['percussive'][:, None] - catalog['percussive'][None, start:stop])
+        scores[..., 5] = (harmonic_sim + percussive_sim) / 2
+        # 7. Hash similarity (fraction of equal hashes)
+        scores[..., 6] = (queries['hashes'][:, None, :] == catalog['hashes'][None, start:stop, :]).mean(axis=2)
+        return scores
+
+    def score(self, query_fingerprints, weights):
+        """Weighted similarity of every query against every song: (queries, songs)"""
+        queries = self.query_arrays(query_fingerprints)
+        weights = np.array([weights[name] for name in FEATURE_NAMES], dtype=np.float32)
+        totals = np.empty((len(query_fingerprints), len(self.songs)), dtype=np.float32)
+        for start in range(0, len(self.songs), self.block_rows):
+            stop = min(start + self.block_rows, len(self.songs))
+            totals[:, start:stop] = self.block_scores(queries, start, stop) @ weights
+        return totals
+
+    def top_k(self, query_fingerprints, weights, k=6):
+        """
+        Best k matches per query , highest first , as match result dicts (see make_result).
+        The per-feature scores of the candidates are kept from the scoring pass itself ,
+        only the hash distances and the offset are computed , for the k kept songs.
+        """
+        queries = self.query_arrays(query_fingerprints)
+        weight_vector = np.array([weights[name] for name in FEATURE_NAMES], dtype=np.float32)
+        k = min(k, len(self.songs))
+        if k == 0:
+            return [[] for _ in query_fingerprints]
+
+        # running top k over the blocks: totals , song rows and per-feature scores
+        n_queries = len(query_fingerprints)
+        best_totals = np.empty((n_queries, 0), dtype=np.float32)
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+        best_scores = np.empty((n_queries, 0, len(FEATURE_NAMES)), dtype=np.float32)
+        for start in range(0, len(self.songs), self.block_rows):
+            stop = min(start + self.block_rows, len(self.songs))
+            scores = self.block_scores(queries, start, stop)
+            best_totals = np.concatenate([best_totals, scores @ weight_vector], axis=1)
+            best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, stop), (n_queries, stop - start))], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_totals.shape[1] > k:
+                keep = np.argpartition(-best_totals, k - 1, axis=1)[:, :k]
+                best_totals = np.take_along_axis(best_totals, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep[..., None], axis=1)
+
+        order = np.argsort(-best_totals, axis=1, kind='stable')
+        best_totals = np.take_along_axis(best_totals, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order[..., None], axis=1)
+        distances = self._hash_distances(queries, best_rows)
+        offsets = self._offsets(queries, best_rows)
+
+        results = []
+        for q in range(n_queries):
+            results.append([
+                make_result(self.songs[row], best_totals[q, j], best_scores[q, j], weights,
+                            dict(zip(self.hash_names, distances[q, j].tolist())), offsets[q, j])
+                for j, row in enumerate(best_rows[q])
+            ])
+        return results
+
+    def _hash_distances(self, queries, rows):
+        """Hamming distance (bits) of every hash , (queries , candidates , hashes)"""
+        differing = queries['hashes'][:, None, :] ^ self.data['hashes'][rows]
+        if hasattr(np, 'bitwise_count'):
+            return np.bitwise_count(differing).astype(np.int64)
+        bits = np.unpackbits(differing.view(np.uint8)[..., None], axis=-1).sum(axis=-1)
+        return bits.reshape(*differing.shape, 8).sum(axis=-1)
+
+    def _offsets(self, queries, rows):
+        """Lag (seconds) that best aligns each query's onset envelope with the candidate's"""
+        frames = queries['matrices']['onset_pattern'].shape[1]
+        if frames == 0:
+            return np.zeros(rows.shape)
+        # mean removed over the real frames only , the zero padding stays zero
+        query_onsets = _center(queries['matrices']['onset_pattern'], queries['onset_frames'])
+        song_onsets = _center(self.data['matrices']['onset_pattern'][rows], self.data['onset_frames'][rows])
+        n = 2 * frames
+        query_spectrum = np.fft.rfft(query_onsets, n)
+        song_spectrum = np.fft.rfft(song_onsets, n)
+        # correlation[lag] = sum_t query[t] * song[t + lag]
+        correlation = np.fft.irfft(np.conj(query_spectrum[:, None, :]) * song_spectrum, n)
+        lags = np.argmax(correlation, axis=2)
+        lags = np.where(lags >= frames, lags - n, lags)
+        return lags * ONSET_FRAME_SECONDS
+
+
+def make_result(song, similarity, scores, weights, hash_distances, offset):
+    """
+    One explained match:
+        song , similarity      the ranking score
+        scores                 per-feature similarity , FEATURE_NAMES order
+        contributions          weight * score per feature (they sum to similarity)
+        hash_distances         hamming distance in bits per perceptual hash
+        offset                 seconds into the song where the query lines up (None when unknown)
+    """
+    scores = {name: float(score) for name, score in zip(FEATURE_NAMES, scores)}
+    return {
+        'song': song,
+        'similarity': float(similarity),
+        'scores': scores,
+        'contributions': {name: weights[name] * score for name, score in scores.items()},
+        'hash_distances': hash_distances,
+        'offset': None if offset is None else float(offset)
+    }
+
+
+def _pack_fingerprints(fingerprints, shapes, hash_count=None, hash_fill=np.iinfo(np.uint64).max):
+    """All arrays needed by block_scores for a list of fingerprints"""
+    return {
+        'matrices': {
+            name: _pack([fingerprint['features'][name] for fingerprint in fingerprints], shapes[name])
+            for name in COSINE_FEATURES
+        },
+        'tempo': _scalars(fingerprints, 'tempo'),
+        'harmonic': _scalars(fingerprints, 'harmonic_ratio'),
+        'percussive': _scalars(fingerprints, 'percussive_ratio'),
+        'hashes': _pack_hashes(fingerprints, hash_count, hash_fill),
+        # real (unpadded) onset frames per row
+        'onset_frames': np.array([min(len(fingerprint['features']['onset_pattern']), shapes['onset_pattern'][1])
+                                  for fingerprint in fingerprints], dtype=np.int64)
+    }
+
+
+def _flat_items(data):
+    """(key , array) pairs of a packed dict , matrices keyed as ('matrices', name)"""
+    for key, values in data.items():
+        if key == 'matrices':
+            for name, matrix in values.items():
+                yield ('matrices', name), matrix
+        else:
+            yield (key,), values
+
+
+def _flat_get(data, key):
+    return data[key[0]][key[1]] if len(key) == 2 else data[key[0]]
+
+
+def _flat_set(data, key, values):
+    if len(key) == 2:
+        data[key[0]][key[1]] = values
+    else:
+        data[key[0]] = values
+
+
+def _feature_shapes(fingerprints):
+    """(bands , frames) per cosine feature , the largest over the fingerprints"""
+    shapes = {}
+    for name in COSINE_FEATURES:
+        matrices = [np.atleast_2d(np.asarray(fingerprint['features'][name])) for fingerprint in fingerprints]
+        shapes[name] = (max((matrix.shape[0] for matrix in matrices), default=0),
+                        max((matrix.shape[1] for matrix in matrices), default=0))
+    return shapes
+
+
+def _pack(matrices, shape):
+    """Pad / cut each (bands , frames) matrix to shape along the time axis , flatten and L2 normalize into one row"""
+    bands, frames = shape
+    packed = np.zeros((len(matrices), bands, frames), dtype=np.float32)
+    for i, matrix in enumerate(matrices):
+        # 1-d features (onset envelope) are one band
+        matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))[:bands, :frames]
+        packed[i, :matrix.shape[0], :matrix.shape[1]] = matrix
+    packed = packed.reshape(len(matrices), bands * frames)
+    norms = np.linalg.norm(packed, axis=1, keepdims=True)
+    # zero rows stay zero (cosine 0 , like sklearn)
+    np.divide(packed, norms, out=packed, where=norms > 0)
+    return packed
+
+
+def _center(rows, lengths):
+    """Subtract from each row the mean of its first lengths values , zero after them"""
+    real = np.arange(rows.shape[-1]) < lengths[..., None]
+    means = np.where(real, rows, 0).sum(axis=-1, keepdims=True) / np.maximum(lengths[..., None], 1)
+    return np.where(real, rows - means, 0)
+
+
+def _scalars(fingerprints, name):
+    return np.array([fingerprint['features'][name] for fingerprint in fingerprints], dtype=np.float32)
+
+
+def _pack_hashes(fingerprints, count=None, fill=np.iinfo(np.uint64).max):
+    """Perceptual hashes (hex strings) as a (fingerprints, count) uint64 array"""
+    rows = [[int(h, 16) for h in fingerprint['hashes'].values()] for fingerprint in fingerprints]
+    if count is None:
+        count = max((len(row) for row in rows), default=0)
+    # missing hashes never match (queries and songs use different fill values)
+    packed = np.full((len(rows), count), fill, dtype=np.uint64)
+    for i, row in enumerate(rows):
+        packed[i, :min(len(row), count)] = row[:count]
+    return packed
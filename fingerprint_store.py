@@ -0,0 +1,268 @@
+"""
+Append-only fingerprint database.
+
+Layout of the database folder:
+    MANIFEST.json       committed segments and their committed byte lengths (+ 'imported' once
+                        the old json database was migrated)
+    seg-000001.jsonl    one record per line: {"op": "put" | "delete", "name": ..., "fingerprint": ...}
+                        or {"op": "source", "name": ..., "source": ...} (size / mtime / hash of the
+                        song file , kept apart so restamping a file never rewrites its fingerprint)
+    LOCK                held by the single writer (ingest / compaction)
+
+A write appends a record to the active segment , fsyncs it , then swaps in a new manifest
+with os.replace , so it costs the size of that record and a crash leaves the previous
+manifest valid. Readers only read up to the committed lengths of the manifest they
+opened , which gives them a consistent snapshot while a writer is appending.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+MANIFEST = "MANIFEST.json"
+LOCK = "LOCK"
+
+
+class FingerprintStore:
+    def __init__(self, path, max_segment_bytes=64 * 1024 * 1024, compact_ratio=0.5):
+        self.path = path
+        self.max_segment_bytes = max_segment_bytes
+        # compact when less than this fraction of the stored records is still live
+        self.compact_ratio = compact_ratio
+        os.makedirs(path, exist_ok=True)
+        # reader state: bytes already read per segment , for incremental refresh
+        self._read_offsets = {}
+        self._records = 0
+        # {name: source} of the last load/refresh
+        self.sources = {}
+        self._compaction = None
+
+    # ------------------------------------------------------------------ reading
+    def load(self):
+        """Read a consistent snapshot of the whole catalog: {name: fingerprint}"""
+        features, self.sources, self._read_offsets, self._records = self._read_snapshot()
+        return features
+
+    def _read_snapshot(self):
+        for _ in range(5):
+            try:
+                features, sources, offsets = {}, {}, {}
+                records = self._read_into(features, sources, offsets, self._read_manifest())
+                return features, sources, offsets, records
+            except FileNotFoundError:
+                # a compaction removed a segment of the manifest we opened , use the new one
+                continue
+        raise RuntimeError(f"could not read a consistent snapshot of {self.path}")
+
+    def refresh(self, features):
+        """
+        Apply the records committed since the last load/refresh to features (in place).
+        Returns the names whose fingerprint was put or deleted , or None when everything was reloaded.
+        """
+        manifest = self._read_manifest()
+        files = {segment['file'] for segment in manifest['segments']}
+        if set(self._read_offsets) <= files:
+            touched = set()
+            try:
+                self._records += self._read_into(features, self.sources, self._read_offsets, manifest, touched)
+                return touched
+            except FileNotFoundError:
+                pass
+        # compacted since our snapshot >> start over
+        features.clear()
+        features.update(self.load())
+        return None
+
+    def _read_into(self, features, sources, offsets, manifest, touched=None):
+        """Apply the committed records after offsets , returns the number of records read"""
+        records = 0
+        for segment in manifest['segments']:
+            start = offsets.get(segment['file'], 0)
+            if segment['length'] <= start:
+                continue
+            with open(os.path.join(self.path, segment['file']), 'rb') as f:
+                f.seek(start)
+                # never past the committed length , a writer may be appending right now
+                data = f.read(segment['length'] - start)
+            for line in data.splitlines():
+                record = json.loads(line)
+                if record['op'] == 'source':
+                    sources[record['name']] = record['source']
+                    records += 1
+                    continue
+                if record['op'] == 'put':
+                    features[record['name']] = record['fingerprint']
+                elif record['op'] == 'delete':
+                    features.pop(record['name'], None)
+                    sources.pop(record['name'], None)
+                if touched is not None:
+                    touched.add(record['name'])
+                records += 1
+            offsets[segment['file']] = segment['length']
+        return records
+
+    def _read_manifest(self):
+        manifest_path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return {'segments': [], 'next_segment': 1}
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    # ------------------------------------------------------------------ writing
+    def put(self, name, fingerprint):
+        """Add or replace one fingerprint"""
+        self._append([{'op': 'put', 'name': name, 'fingerprint': fingerprint}])
+
+    def put_many(self, items):
+        """Add or replace several fingerprints in one commit"""
+        self._append([{'op': 'put', 'name': name, 'fingerprint': fingerprint} for name, fingerprint in items])
+
+    def put_sources(self, items):
+        """Record the source file metadata of several songs in one commit (fingerprints untouched)"""
+        items = list(items)
+        self._append([{'op': 'source', 'name': name, 'source': source} for name, source in items])
+        self.sources.update(items)
+
+    def delete(self, name):
+        """Remove one fingerprint"""
+        self._append([{'op': 'delete', 'name': name}])
+        self.sources.pop(name, None)
+
+    def delete_many(self, names):
+        """Remove several fingerprints in one commit"""
+        names = list(names)
+        self._append([{'op': 'delete', 'name': name} for name in names])
+        for name in names:
+            self.sources.pop(name, None)
+
+    def _append(self, records, **manifest_fields):
+        if not records and not manifest_fields:
+            return
+        data = b''.join(json.dumps(record).encode('utf-8') + b'\n' for record in records)
+        with self._write_lock():
+            manifest = self._read_manifest()
+            segments = manifest['segments']
+            # nobody else wrote since our last read >> our own records need no re-read by refresh
+            up_to_date = all(self._read_offsets.get(segment['file'], 0) == segment['length'] for segment in segments)
+            if not segments or segments[-1]['length'] + len(data) > self.max_segment_bytes:
+                segments.append({'file': f"seg-{manifest['next_segment']:06d}.jsonl", 'length': 0})
+                manifest['next_segment'] += 1
+            active = segments[-1]
+            with open(os.path.join(self.path, active['file']), 'ab') as f:
+                # drop a torn tail left by a writer that crashed before its manifest swap
+                f.truncate(active['length'])
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            active['length'] += len(data)
+            manifest.update(manifest_fields)
+            self._write_manifest(manifest)
+            if up_to_date:
+                self._read_offsets[active['file']] = active['length']
+                self._records += len(records)
+
+    def _write_manifest(self, manifest):
+        tmp_path = os.path.join(self.path, MANIFEST + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        # atomic: readers see the old or the new manifest , never a torn one
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+        _fsync_dir(self.path)
+
+    @contextmanager
+    def _write_lock(self):
+        with open(os.path.join(self.path, LOCK), 'a+') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    # ------------------------------------------------------------------ compaction
+    def compact(self):
+        """Rewrite the live fingerprints into one segment and drop the old segments"""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            old_files = [segment['file'] for segment in manifest['segments']]
+            # own snapshot , the reader state of this instance may be in use by another thread
+            features, sources, _, _ = self._read_snapshot()
+            new_file = f"seg-{manifest['next_segment']:06d}.jsonl"
+            with open(os.path.join(self.path, new_file), 'wb') as f:
+                for name, fingerprint in features.items():
+                    f.write(json.dumps({'op': 'put', 'name': name, 'fingerprint': fingerprint}).encode('utf-8') + b'\n')
+                for name, source in sources.items():
+                    f.write(json.dumps({'op': 'source', 'name': name, 'source': source}).encode('utf-8') + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+                length = f.tell()
+            # keep the other manifest fields ('imported')
+            self._write_manifest(dict(
+                manifest,
+                segments=[{'file': new_file, 'length': length}],
+                next_segment=manifest['next_segment'] + 1
+            ))
+            # readers still on the old manifest reload when a segment is gone. Every segment the
+            # manifest does not list goes , also ones left by an earlier compaction that could
+            # not remove them (open on windows , or the process ended right after the swap)
+            for file in os.listdir(self.path):
+                if file.startswith('seg-') and file.endswith('.jsonl') and file != new_file:
+                    try:
+                        os.remove(os.path.join(self.path, file))
+                    except OSError:
+                        pass  # still open on windows , removed by the next compaction
+        print(f"compacted fingerprint database : {len(old_files)} segments -> 1 , {len(features)} songs")
+
+    def compact_in_background(self, live_count):
+        """Start a compaction thread when less than compact_ratio of the records read are live"""
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        # live_count fingerprints , plus one source record per recorded song
+        live_count += len(self.sources)
+        if self._records and live_count / self._records < self.compact_ratio:
+            self._compaction = threading.Thread(target=self.compact, daemon=True)
+            self._compaction.start()
+
+    def wait_for_compaction(self):
+        """Block until a background compaction is done (call before a script exits , it is a daemon thread)"""
+        if self._compaction is not None:
+            self._compaction.join()
+
+    def imported(self):
+        """True once the old json database was imported , or the store was written to before"""
+        manifest = self._read_manifest()
+        return manifest.get('imported', False) or bool(manifest['segments'])
+
+    def import_json(self, json_path):
+        """One time migration from the old single json file database , recorded in the manifest"""
+        with open(json_path, 'r') as f:
+            features = json.load(f)
+        # same commit as the records , so a crash never leaves a half recorded migration
+        self._append([{'op': 'put', 'name': name, 'fingerprint': fingerprint}
+                      for name, fingerprint in features.items()], imported=True)
+        return features
+
+
+def _fsync_dir(path):
+    if not hasattr(os, 'O_DIRECTORY'):
+        return  # not supported on windows
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
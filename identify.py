@@ -0,0 +1,36 @@
+"""
+Identify audio files from the command line , with the per-feature breakdown of every match.
+
+Usage:
+    python identify.py clip1.wav clip2.mp3 --top-k 3
+    python identify.py noisy_clip.wav --robust
+"""
+import argparse
+
+from Features import AudioFingerprint, format_match
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Identify audio files against the fingerprint database")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--top-k', type=int, default=6)
+    parser.add_argument('--robust', action='store_true', help="noise robust matching")
+    args = parser.parse_args()
+
+    fingerprinter = AudioFingerprint(robust=args.robust)
+    queries = []
+    for path in args.files:
+        fingerprint = fingerprinter.generate_fingerprint(path)
+        if fingerprint:
+            queries.append((path, fingerprint))
+
+    # all queries scored in one batch , the breakdown comes with the results
+    results = fingerprinter.find_matches_batch([fingerprint for _, fingerprint in queries], args.top_k)
+    for (path, _), matches in zip(queries, results):
+        print(f"\n{path}")
+        for rank, result in enumerate(matches, 1):
+            print(f"{rank}. {format_match(result)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Mixing engine for N audio files.
+
+Inputs may be any format soundfile can read (wav , flac , ogg , mp3 with libsndfile >= 1.1) ,
+anything else is decoded with librosa. Every input is resampled to one common rate with a
+streaming soxr resampler and the tracks are mixed block by block: one block of every track
+is stacked into a (tracks , frames , channels) float32 array and weighted in a single
+tensordot , so memory stays bounded by the block size whatever the length of the files.
+"""
+import math
+import os
+import threading
+
+import numpy as np
+
+
+class MixEngine:
+    def __init__(self, paths, gains, samplerate=None):
+        self.paths = list(paths)
+        infos = [_probe(path) for path in self.paths]
+        self.rates = [rate for rate, _, _ in infos]
+        # highest input rate by default , nothing gets downsampled
+        self.samplerate = samplerate or max(self.rates)
+        self.channels = max(channels for _, channels, _ in infos)
+        # trim to the shortest track (in output frames)
+        self.length = min(frames * self.samplerate // rate for rate, _, frames in infos)
+        # bumped by set_gains , a background peak pass for older weights is dropped
+        self._generation = 0
+        self.set_gains(gains)
+
+    def set_gains(self, gains):
+        """
+        Change the track weights , open readers use them from their next block.
+        A real mix is normalized to its peak like the old output_mix.wav. The peak needs a
+        pass over the inputs , so it runs in the background: until it is known the mix is
+        scaled by the sum of the weights (never clips) and playback does not wait for it.
+        """
+        gains = np.asarray(gains, dtype=np.float32)
+        if not np.any(gains):
+            # every weight at 0: the last track as-is , like the old mixer (never a silent mix)
+            gains = np.zeros_like(gains)
+            gains[-1] = 1.0
+        active = np.flatnonzero(gains)
+        self._generation += 1
+        if len(active) == 1:
+            # a single track is played as-is
+            scale = 1.0 / gains[active[0]]
+        else:
+            scale = 1.0 / float(np.sum(np.abs(gains)))
+            threading.Thread(target=self._normalize, args=(gains, self._generation), daemon=True).start()
+        # swap in one assignment so the audio thread never sees a half updated mix
+        self._mix = gains * np.float32(scale)
+        self._gains = gains
+        self.blended = len(active) > 1
+
+    def _normalize(self, gains, generation):
+        """Background peak pass , applied only if the weights did not change meanwhile"""
+        peak = self.peak(gains)
+        if peak > 0 and generation == self._generation:
+            self._mix = gains / np.float32(peak)
+
+    def query_audio(self, seconds=30):
+        """
+        The first seconds of the mix for fingerprinting: a blend normalized to the peak of
+        this window (loudness like the old output_mix.wav without the full pass) , a single
+        track as-is.
+        """
+        # fixed weights , the background peak pass may rescale the mix while this renders
+        mix = self._gains if self.blended else self._mix
+        audio = self.render(0, int(seconds * self.samplerate), mix=mix)
+        peak = float(np.abs(audio).max()) if len(audio) else 0.0
+        if self.blended and peak > 0:
+            audio = audio / peak
+        return audio
+
+    def reader(self, mix=None):
+        """Independent reader (own file handles and resamplers) , one per consumer thread"""
+        return MixReader(self, mix=mix)
+
+    def peak(self, gains):
+        """Largest absolute sample of the mix with these (unnormalized) weights"""
+        mix = np.asarray(gains, dtype=np.float32)
+        return max((float(np.abs(block).max()) for block in self.blocks(mix=mix) if len(block)), default=0.0)
+
+    def blocks(self, start=0, stop=None, block_frames=65536, mix=None):
+        """Yield the mix from start to stop as consecutive blocks"""
+        stop = self.length if stop is None else min(stop, self.length)
+        reader = self.reader(mix)
+        try:
+            for block_start in range(start, stop, block_frames):
+                yield reader.read(block_start, min(block_frames, stop - block_start))
+        finally:
+            reader.close()
+
+    def render(self, start, frames, block_frames=65536, mix=None):
+        """Mix [start , start + frames) into one array"""
+        stop = min(start + frames, self.length)
+        out = np.zeros((max(stop - start, 0), self.channels), dtype=np.float32)
+        position = 0
+        for block in self.blocks(start, stop, block_frames, mix):
+            out[position:position + len(block)] = block
+            position += len(block)
+        return out
+
+
+class MixReader:
+    """Reads the mix of a MixEngine , sequential reads continue without seeking"""
+
+    def __init__(self, engine, input_block=16384, prime_frames=2048, mix=None):
+        self.engine = engine
+        # fixed weights instead of the engine's current ones
+        self.mix = mix
+        self.prime_frames = prime_frames
+        self.samplerate = engine.samplerate
+        self.channels = engine.channels
+        self.length = engine.length
+        self.input_block = input_block
+        self.tracks = [_open(path) for path in engine.paths]
+        self._position = None
+
+    def read(self, start, frames):
+        """Return the mixed block [start , start + frames) , shorter at the end."""
+        stop = min(start + frames, self.length)
+        if start >= stop:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        if start != self._position:
+            self._seek(start)
+        n = stop - start
+        stack = np.empty((len(self.tracks), n, self.channels), dtype=np.float32)
+        for i in range(len(self.tracks)):
+            stack[i] = _match_channels(self._pull(i, n), self.channels)
+        self._position = stop
+        mix = self.engine._mix if self.mix is None else self.mix
+        return np.tensordot(mix, stack, axes=1)
+
+    def close(self):
+        for track in self.tracks:
+            track['file'].close()
+
+    def _seek(self, start):
+        for i, (track, rate) in enumerate(zip(self.tracks, self.engine.rates)):
+            # a fresh resampler needs input before the seek point to settle , start it
+            # prime_frames early on an input frame that falls exactly on an output frame
+            step = rate // math.gcd(rate, self.samplerate)
+            input_start = max(start * rate // self.samplerate - self.prime_frames, 0) // step * step
+            track['file'].seek(input_start)
+            track['resampler'] = _resampler(rate, self.samplerate, track['file'].channels)
+            track['pending'] = []
+            track['pending_frames'] = 0
+            track['eof'] = False
+            # drop the priming output
+            skip = start - input_start * self.samplerate // rate
+            if skip:
+                self._pull(i, skip)
+
+    def _pull(self, i, frames):
+        """Exactly frames resampled frames of track i (zero padded after its end)"""
+        track = self.tracks[i]
+        while track['pending_frames'] < frames and not track['eof']:
+            chunk = track['file'].read(self.input_block, dtype='float32', always_2d=True)
+            track['eof'] = len(chunk) < self.input_block
+            if track['resampler'] is not None:
+                chunk = track['resampler'].resample_chunk(chunk, last=track['eof'])
+            track['pending'].append(chunk)
+            track['pending_frames'] += len(chunk)
+
+        pending = np.concatenate(track['pending']) if track['pending'] else \
+            np.zeros((0, track['file'].channels), dtype=np.float32)
+        block = pending[:frames]
+        if len(block) < frames:
+            block = np.concatenate([block, np.zeros((frames - len(block), block.shape[1]), dtype=np.float32)])
+        track['pending'] = [pending[frames:]]
+        track['pending_frames'] = len(pending) - min(frames, len(pending))
+        return block
+
+
+class _ArrayFile:
+    """In-memory stand-in for soundfile.SoundFile (formats soundfile cannot read)"""
+
+    def __init__(self, data, samplerate):
+        self.data = data
+        self.samplerate = samplerate
+        self.channels = data.shape[1]
+        self.frames = len(data)
+        self.position = 0
+
+    def seek(self, frame):
+        self.position = min(frame, self.frames)
+
+    def read(self, frames, dtype='float32', always_2d=True):
+        block = self.data[self.position:self.position + frames]
+        self.position += len(block)
+        return block
+
+    def close(self):
+        pass
+
+
+# decoded files soundfile cannot stream , so readers of the same file decode it once
+_decoded = {}
+_max_decoded = 4
+
+
+def _open_file(path):
+    import soundfile as sf
+    try:
+        return sf.SoundFile(path)
+    except (RuntimeError, TypeError):
+        key = (path, os.path.getmtime(path))
+        if key not in _decoded:
+            import librosa
+            data, rate = librosa.load(path, sr=None, mono=False)
+            if len(_decoded) >= _max_decoded:
+                _decoded.pop(next(iter(_decoded)))
+            _decoded[key] = (np.ascontiguousarray(np.atleast_2d(data).T, dtype=np.float32), rate)
+        return _ArrayFile(*_decoded[key])
+
+
+def _probe(path):
+    audio_file = _open_file(path)
+    try:
+        return audio_file.samplerate, audio_file.channels, audio_file.frames
+    finally:
+        audio_file.close()
+
+
+def _open(path):
+    audio_file = _open_file(path)
+    return {'file': audio_file, 'resampler': None, 'pending': [], 'pending_frames': 0, 'eof': False}
+
+
+def _resampler(rate, target_rate, channels):
+    if rate == target_rate:
+        return None
+    import soxr
+    return soxr.ResampleStream(rate, target_rate, channels, dtype='float32')
+
+
+def _match_channels(block, channels):
+    if block.shape[1] == channels:
+        return block
+    if block.shape[1] != 1:
+        block = block.mean(axis=1, keepdims=True)
+    return np.broadcast_to(block, (len(block), channels))
@@ -3,7 +3,7 @@ from PyQt5.QtWidgets import QWidget, QVBoxLayout
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import numpy as np
-import librosa.display
+import librosa
 from scipy.signal import spectrogram
 
 
@@ -23,31 +23,69 @@ class spec_Widget(QWidget):
         # # Set the color of the axes to white
         # self.canvas.axes.tick_params(axis='both', colors='white')
         self.setLayout(vertical_layout)
+        # rendered (downsampled) spectrograms per file and widget size
+        self.image_cache = {}
+        self.max_cached_images = 32
 
 
-    def plot_spectrogram(self, data, sample_rate, x_label='Time', y_label='Frequency' ,  n_fft=2048):
-        if data is None or len(data) == 0:
+    def plot_spectrogram(self, data, sample_rate, x_label='Time', y_label='Frequency' ,  n_fft=2048,
+                         mel_spec_db=None, cache_key=None, hop_length=512, fmax=8000):
+        """
+        Draw the spectrogram reduced to the widget's pixel size.
+        mel_spec_db: the fingerprint's mel spectrogram (hop_length , fmax as in extract_features) , reused instead of a new stft.
+        cache_key: e.g. the file path , the rendered image is kept and redrawn without recomputing.
+        """
+        if mel_spec_db is None and (data is None or len(data) == 0):
             return  # Exit the function if data is empty
-        self.canvas.axes.clear()  # Clear previous plot
-        n_fft = min(n_fft, len(data))
-        try:
-            spectrogram = librosa.amplitude_to_db(
-                np.abs(librosa.stft(data, n_fft=n_fft)),
-                ref=np.max
-            )
-        except ValueError as e:
-            print("hereeee")
-            return
+        width = max(self.canvas.width(), 1)
+        height = max(self.canvas.height(), 1)
+        key = (cache_key, width, height)
+
+        if cache_key is not None and key in self.image_cache:
+            image, freqs, duration = self.image_cache[key]
+        else:
+            if mel_spec_db is not None:
+                spectrogram = np.asarray(mel_spec_db)
+                freqs = librosa.mel_frequencies(n_mels=spectrogram.shape[0], fmax=fmax)
+                duration = spectrogram.shape[1] * hop_length / sample_rate
+            else:
+                # n_fft stays fixed (bounded rows) , only the hop grows so the stft has about
+                # one frame per pixel column , long files stay cheap
+                n_fft = min(n_fft, len(data))
+                hop = max(n_fft // 4, len(data) // width)
+                try:
+                    spectrogram = librosa.amplitude_to_db(
+                        np.abs(librosa.stft(data, n_fft=n_fft, hop_length=hop)),
+                        ref=np.max
+                    )
+                except ValueError as e:
+                    print("hereeee")
+                    return
+                freqs = librosa.fft_frequencies(sr=sample_rate, n_fft=n_fft)
+                duration = len(data) / sample_rate
+                # log frequency axis like specshow(y_axis='log')
+                spectrogram, freqs = _log_rows(spectrogram, freqs, height)
+
+            image = _reduce_columns(spectrogram, width)
+            image = _reduce_columns(image.T, height).T
+            freqs = freqs[np.linspace(0, len(freqs), image.shape[0], endpoint=False).astype(int)]
+            if cache_key is not None:
+                if len(self.image_cache) >= self.max_cached_images:
+                    self.image_cache.pop(next(iter(self.image_cache)))  # drop the oldest
+                self.image_cache[key] = (image, freqs, duration)
 
-        # Display the spectrogram with axes and labels
-        librosa.display.specshow(
-            spectrogram,
-            sr=sample_rate,
-            x_axis='time',
-            y_axis='log',
-            ax=self.canvas.axes,
+        self.canvas.axes.clear()  # Clear previous plot
+        self.canvas.axes.imshow(
+            image,
+            origin='lower',
+            aspect='auto',
+            interpolation='nearest',
+            extent=[0, duration, 0, image.shape[0]],
             cmap='magma'  # Optional: set a color map
         )
+        ticks = np.linspace(0, image.shape[0] - 1, 5).astype(int)
+        self.canvas.axes.set_yticks(ticks + 0.5)
+        self.canvas.axes.set_yticklabels([f"{freqs[t]:.0f}" for t in ticks])
 
         # Set labels if needed
         self.canvas.axes.set_xlabel(x_label)
@@ -58,7 +96,31 @@ class spec_Widget(QWidget):
         self.canvas.figure.subplots_adjust(left=0.1, right=1, top=1, bottom=0.08)
         self.canvas.draw()
 
+    def plot_fingerprint(self, fingerprinter, name, data=None, sample_rate=22050):
+        """Draw the spectrogram of a fingerprinted file , from fingerprinter.spectrograms when it is still there"""
+        mel_spec_db, sr = fingerprinter.spectrograms.get(name, (None, sample_rate))
+        self.plot_spectrogram(data, sr, mel_spec_db=mel_spec_db, cache_key=name)
+
     def clear(self):
         self.canvas.axes.clear()
         self.canvas.axes.set_axis_off()  # Remove the axes
         self.canvas.draw()
+
+
+def _log_rows(spectrogram, freqs, size):
+    """Resample the linear stft rows onto size log spaced frequencies (max over the rows of each band)"""
+    if len(freqs) < 2:
+        return spectrogram, freqs
+    targets = np.geomspace(freqs[1], freqs[-1], size + 1)[:-1]
+    rows = np.searchsorted(freqs, targets)
+    # low bands narrower than one stft row repeat that row
+    return np.maximum.reduceat(spectrogram, rows, axis=0), targets
+
+
+def _reduce_columns(spectrogram, size):
+    """Max-pool groups of columns down to size columns , so short loud events stay visible"""
+    columns = spectrogram.shape[1]
+    if columns <= size:
+        return spectrogram
+    edges = np.linspace(0, columns, size, endpoint=False).astype(int)
+    return np.maximum.reduceat(spectrogram, edges, axis=1)
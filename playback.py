@@ -0,0 +1,143 @@
+import queue
+import threading
+
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class ChunkedPlayer(QObject):
+    """
+    Plays a mixer.MixReader through a sounddevice callback stream (no temp files).
+    A producer thread reads (decodes , resamples , mixes) the source ahead into a bounded
+    queue , the audio callback only copies from it so disk and cpu spikes never cause dropouts.
+    """
+
+    # same values as QMediaPlayer.State
+    StoppedState, PlayingState, PausedState = 0, 1, 2
+
+    stateChanged = pyqtSignal(int)
+    _ended = pyqtSignal(object)
+
+    def __init__(self, blocksize=2048, read_frames=8192, buffer_blocks=8, parent=None):
+        super().__init__(parent)
+        self.blocksize = blocksize
+        # about 1.5 s buffered at 44.1 kHz , gain changes are heard after this delay
+        self.read_frames = read_frames
+        self.buffer_blocks = buffer_blocks
+        self.source = None
+        # frames already played
+        self.position = 0
+        self.stream = None
+        self._producer = None
+        self._state = self.StoppedState
+        # finished_callback runs on the audio thread >> hop back to the GUI thread
+        self._ended.connect(self._on_ended)
+
+    def state(self):
+        return self._state
+
+    def setSource(self, source):
+        self.stop()
+        if self.source is not None:
+            self.source.close()
+        self.source = source
+        self.position = 0
+
+    def play(self):
+        if self.source is None or self._state == self.PlayingState:
+            return
+        if self.position >= self.source.length:
+            self.position = 0
+        # imported on first playback , not at startup
+        import sounddevice as sd
+        self._callback_stop = sd.CallbackStop
+        self._buffer = queue.Queue(maxsize=self.buffer_blocks)
+        self._pending = np.zeros((0, self.source.channels), dtype=np.float32)
+        self._producer_stop = threading.Event()
+        ready = threading.Event()
+        self._producer = threading.Thread(
+            target=self._produce, args=(self.position, self._buffer, self._producer_stop, ready), daemon=True)
+        self._producer.start()
+        # wait for the first block only (no silent first callbacks , no noticeable delay)
+        ready.wait(0.5)
+        stream = sd.OutputStream(
+            samplerate=self.source.samplerate,
+            channels=self.source.channels,
+            blocksize=self.blocksize,
+            dtype='float32',
+            callback=self._callback,
+            finished_callback=lambda: self._ended.emit(stream)
+        )
+        self.stream = stream
+        stream.start()
+        self._set_state(self.PlayingState)
+
+    def pause(self):
+        if self._state != self.PlayingState:
+            return
+        self._close_stream()
+        self._set_state(self.PausedState)
+
+    def stop(self):
+        self._close_stream()
+        self.position = 0
+        self._set_state(self.StoppedState)
+
+    def _produce(self, position, buffer, stop_event, ready):
+        """Producer thread: read the source ahead , an empty block marks its end"""
+        while not stop_event.is_set():
+            block = self.source.read(position, self.read_frames)
+            position += len(block)
+            while not stop_event.is_set():
+                try:
+                    buffer.put(block, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            # the first block is enough to start the device , the rest fills while it plays
+            ready.set()
+            if len(block) == 0:
+                return
+
+    def _callback(self, outdata, frames, time, status):
+        # only copies , never reads the source on the audio thread
+        filled = 0
+        while filled < frames:
+            if len(self._pending) == 0:
+                try:
+                    self._pending = self._buffer.get_nowait()
+                except queue.Empty:
+                    break  # producer behind >> silence for the rest of this block
+                if len(self._pending) == 0:
+                    outdata[filled:] = 0
+                    self.position += filled
+                    raise self._callback_stop
+            n = min(frames - filled, len(self._pending))
+            outdata[filled:filled + n] = self._pending[:n]
+            self._pending = self._pending[n:]
+            filled += n
+        outdata[filled:] = 0
+        self.position += filled
+
+    def _close_stream(self):
+        stream, self.stream = self.stream, None
+        if stream is not None:
+            stream.stop()
+            stream.close()
+        # the source is not thread safe , the producer must be gone before it is read or closed again
+        producer, self._producer = self._producer, None
+        if producer is not None:
+            self._producer_stop.set()
+            producer.join()
+
+    def _on_ended(self, stream):
+        # ignore streams that were closed by pause/stop
+        if stream is self.stream:
+            self._close_stream()
+            self.position = 0
+            self._set_state(self.StoppedState)
+
+    def _set_state(self, state):
+        if state != self._state:
+            self._state = state
+            self.stateChanged.emit(state)
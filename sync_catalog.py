@@ -0,0 +1,45 @@
+"""
+Keep the fingerprint database in sync with a music folder.
+
+Only added , changed (size / mtime , then content hash) and removed songs are touched.
+
+Usage:
+    python sync_catalog.py Data_base            (one sync)
+    python sync_catalog.py Data_base --watch    (poll every 2 seconds)
+    python sync_catalog.py Data_base --robust   (also add peak hashes to older fingerprints)
+"""
+import argparse
+import time
+
+from Features import AudioFingerprint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental catalog sync from a folder")
+    parser.add_argument('database_folder')
+    parser.add_argument('--watch', action='store_true', help="keep polling the folder")
+    parser.add_argument('--interval', type=float, default=2.0, help="seconds between polls")
+    parser.add_argument('--robust', action='store_true',
+                        help="also regenerate fingerprints without peak hashes (for robust matching)")
+    args = parser.parse_args()
+
+    fingerprinter = AudioFingerprint(robust=args.robust)
+    if args.watch:
+        print(f"watching {args.database_folder} (ctrl+c to stop)")
+        try:
+            fingerprinter.watch_folder(args.database_folder, args.interval)
+        except KeyboardInterrupt:
+            pass
+        fingerprinter.wait_for_compaction()
+        return
+
+    start = time.perf_counter()
+    added, changed, removed = fingerprinter.sync_folder(args.database_folder)
+    print(f"sync took {time.perf_counter() - start:.3f}s : {len(added)} added , "
+          f"{len(changed)} changed , {len(removed)} removed , {len(fingerprinter.features)} songs")
+    # the compaction runs in a daemon thread , let it finish before the interpreter exits
+    fingerprinter.wait_for_compaction()
+
+
+if __name__ == "__main__":
+    main()
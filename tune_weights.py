@@ -0,0 +1,147 @@
+"""
+Tune the similarity weights of AudioFingerprint against a labelled query set.
+
+The query set is a json list like:
+    [
+        {"query": "Queries/adele_full.mp3", "matches": ["Adele_SetFireToRain_(full).mp3"]},
+        {"query": "Adele_SetFireToRain_(vocals).mp3", "matches": ["Amr_Diab_(vocals).mp3"]}
+    ]
+"query" is a file path , or the name of a song already in the database (it is then
+excluded from its own candidates). "matches" are the database songs counted as correct.
+
+Usage:
+    python tune_weights.py queries.json --samples 20000 --top-k 3
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from Features import AudioFingerprint, DEFAULT_WEIGHTS, FEATURE_NAMES
+
+
+def build_score_tensor(fingerprinter, query_set):
+    """
+    Score every query against every song once , per feature: (queries, songs, features).
+    Uses the matcher's own batch scoring (CatalogIndex.block_scores) , so the weights are
+    tuned for exactly the scores the app ranks with.
+    """
+    index = fingerprinter.catalog_index()
+    songs = index.songs
+    relevant = np.zeros((len(query_set), len(songs)), dtype=bool)
+    excluded = np.zeros((len(query_set), len(songs)), dtype=bool)
+    song_index = {song: i for i, song in enumerate(songs)}
+
+    query_fingerprints = []
+    for q, entry in enumerate(query_set):
+        query = entry['query']
+        if query in song_index:
+            query_fingerprint = fingerprinter.features[query]
+            excluded[q, song_index[query]] = True
+        else:
+            query_fingerprint = fingerprinter.generate_fingerprint(query)
+        if not query_fingerprint:
+            raise ValueError(f"Failed to fingerprint query {query}")
+        query_fingerprints.append(query_fingerprint)
+
+        for match in entry['matches']:
+            if match not in song_index:
+                raise ValueError(f"{match} (expected match of {query}) is not in the database")
+            relevant[q, song_index[match]] = True
+        print(f"fingerprinted query {q + 1}/{len(query_set)} : {query}")
+
+    scores = index.block_scores(index.query_arrays(query_fingerprints), 0, len(index))
+    # a query from the catalog never counts against itself (evaluate_weights also skips it)
+    scores[excluded] = 0
+    return scores, relevant, excluded, songs
+
+
+def evaluate_weights(scores, relevant, excluded, weights, top_k=3, block=1024):
+    """Top-1 and top-k accuracy for many weight vectors (rows of weights) at once"""
+    top1 = np.empty(len(weights))
+    topk = np.empty(len(weights))
+    for start in range(0, len(weights), block):
+        w = weights[start:start + block].astype(np.float32)
+        # (settings, queries, songs) totals in one contraction
+        totals = np.einsum('qcf,kf->kqc', scores, w)
+        totals[:, excluded] = -np.inf
+        best_match = np.where(relevant, totals, -np.inf).max(axis=2)
+        # rank of the best correct match = other songs scoring above or equal to it ,
+        # ties count against the query so features that score every song alike never win
+        rank = (totals >= best_match[..., None]).sum(axis=2) - 1
+        top1[start:start + block] = (rank == 0).mean(axis=1)
+        topk[start:start + block] = (rank < top_k).mean(axis=1)
+    return top1, topk
+
+
+def search_weights(scores, relevant, excluded, samples=20000, top_k=3, rounds=3, seed=0):
+    """Random search over the weight simplex , then refine around the best setting"""
+    rng = np.random.default_rng(seed)
+    default = np.array([DEFAULT_WEIGHTS[name] for name in FEATURE_NAMES])
+    candidates = np.vstack([default, rng.dirichlet(np.ones(len(FEATURE_NAMES)), samples)])
+
+    best = default
+    for round_ in range(rounds + 1):
+        top1, topk = evaluate_weights(scores, relevant, excluded, candidates, top_k)
+        # top-1 first , top-k breaks ties
+        i = np.lexsort((topk, top1))[-1]
+        best, best_top1, best_topk = candidates[i], top1[i], topk[i]
+        print(f"round {round_} : top-1 {best_top1:.3f} , top-{top_k} {best_topk:.3f} "
+              f"over {len(candidates)} settings")
+        # sample close to the best weights for the next round
+        concentration = 50.0 * (round_ + 1)
+        candidates = np.vstack([best, rng.dirichlet(best * concentration + 1e-3, samples)])
+
+    return best, best_top1, best_topk
+
+
+def save_profile(path, weights, top1, topk, top_k, n_queries):
+    """Write a weights profile that AudioFingerprint.load_weights picks up"""
+    profile = {
+        'weights': {name: float(w) for name, w in zip(FEATURE_NAMES, weights)},
+        'top1_accuracy': float(top1),
+        f'top{top_k}_accuracy': float(topk),
+        'queries': n_queries
+    }
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+    print(f"saved weights profile to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune similarity weights on a labelled query set")
+    parser.add_argument('query_set', help="json file with the labelled queries")
+    parser.add_argument('--samples', type=int, default=20000, help="weight settings per round")
+    parser.add_argument('--rounds', type=int, default=3, help="refinement rounds after the random search")
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="profile path (default: the matcher's profile)")
+    args = parser.parse_args()
+
+    fingerprinter = AudioFingerprint()
+    with open(args.query_set, 'r') as f:
+        query_set = json.load(f)
+    start = time.perf_counter()
+    # songs that failed to fingerprint are left out of the index , like in the matcher
+    scores, relevant, excluded, songs = build_score_tensor(fingerprinter, query_set)
+    print(f"score tensor {scores.shape} ({len(songs)} songs) in {time.perf_counter() - start:.2f}s")
+
+    default = np.array([[DEFAULT_WEIGHTS[name] for name in FEATURE_NAMES]])
+    top1, topk = evaluate_weights(scores, relevant, excluded, default, args.top_k)
+    print(f"default weights : top-1 {top1[0]:.3f} , top-{args.top_k} {topk[0]:.3f}")
+
+    start = time.perf_counter()
+    best, best_top1, best_topk = search_weights(
+        scores, relevant, excluded, args.samples, args.top_k, args.rounds, args.seed)
+    elapsed = time.perf_counter() - start
+    evaluated = (args.samples + 1) * (args.rounds + 1)
+    print(f"evaluated {evaluated} settings in {elapsed:.2f}s ({evaluated / elapsed:.0f} settings/s)")
+    print("best weights : " + " , ".join(f"{name} {w:.3f}" for name, w in zip(FEATURE_NAMES, best)))
+
+    output = args.output or fingerprinter.weights_path
+    save_profile(output, best, best_top1, best_topk, args.top_k, len(query_set))
+
+
+if __name__ == "__main__":
+    main()